@@ -0,0 +1,141 @@
+# ai/_commands.py
+
+"""
+What a shell command needs, judged from its text alone: whether it can skip
+the shell entirely, and whether it can run alongside the rest of its batch.
+"""
+
+import re
+import shlex
+import shutil
+import subprocess
+
+# ---------- PLAIN ARGV ----------
+
+# Anything the shell itself would have to interpret: operators, expansion,
+# globbing, escapes, comments, line breaks.
+SHELL_SYNTAX = re.compile(r"[|&;<>()$`\\{}*?\[\]~#!\n]")
+
+# Words that only mean something to a shell: its keywords, plus the
+# builtins with no binary of the same name on PATH (see _shell_builtins).
+SHELL_KEYWORDS = frozenset(
+    {
+        "if", "then", "else", "elif", "fi", "case", "esac", "for", "while",
+        "until", "do", "done", "function", "select", "time", "coproc",
+    }
+)
+# POSIX special builtins and cd, if bash can't be asked for its list.
+POSIX_BUILTINS = frozenset(
+    {
+        "break", ":", "continue", ".", "eval", "exec", "exit", "export",
+        "readonly", "return", "set", "shift", "times", "trap", "unset", "cd",
+    }
+)
+
+
+def _shell_builtins() -> frozenset[str]:
+    """
+    bash's builtins (`compgen -b`) that no PATH binary shares a name with;
+    `echo`, `test`, `kill` and the like behave the same when exec'ed.
+    """
+    bash = shutil.which("bash") or "/bin/bash"
+    try:
+        names = subprocess.run(
+            [bash, "-c", "compgen -b"], capture_output=True, text=True, check=True
+        ).stdout.split()
+    except (OSError, subprocess.CalledProcessError):
+        names = POSIX_BUILTINS
+    return frozenset(name for name in names if shutil.which(name) is None)
+
+
+SHELL_ONLY_WORDS = SHELL_KEYWORDS | _shell_builtins()
+
+
+def plain_argv(command: str) -> list[str] | None:
+    """
+    The argv for `command` if no shell is needed to run it (a program plus
+    optionally quoted arguments), else None.
+    """
+    if SHELL_SYNTAX.search(command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    if not argv or "=" in argv[0] or argv[0] in SHELL_ONLY_WORDS:
+        return None
+    return argv
+
+
+# ---------- READ-ONLY BATCHES ----------
+
+# A batch made up only of these can run concurrently: none of them writes,
+# so there's no ordering between commands to preserve.
+READ_ONLY_PROGRAMS = frozenset(
+    {"cat", "head", "tail", "wc", "ls", "pwd", "echo", "stat", "file", "du", "grep", "rg", "which"}
+)
+READ_ONLY_GIT = frozenset({"status", "diff", "log", "show", "ls-files", "grep", "blame"})
+# Options that make those write a file or run a configured external command.
+GIT_UNSAFE_OPTIONS = ("--output", "--ext-diff", "--textconv")
+FIND_ACTIONS = frozenset(
+    {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"}
+)
+# `sed -n '1,200p' file` – the inspection form the agent instructions suggest
+SED_PRINT_RANGE = re.compile(r"[0-9,]+p")
+SHELL_OPERATOR_CHARS = frozenset("();<>|&")
+
+
+def _is_read_only_argv(argv: list[str]) -> bool:
+    program, args = argv[0], argv[1:]
+    if program == "sed":
+        # Only `sed -n 'N,Mp' file...`; any further option could be -i or -e.
+        return (
+            len(args) >= 2
+            and args[0] == "-n"
+            and SED_PRINT_RANGE.fullmatch(args[1]) is not None
+            and not any(arg.startswith("-") for arg in args[2:])
+        )
+    if program == "find":
+        return not FIND_ACTIONS.intersection(args)
+    if program == "git":
+        return (
+            bool(args)
+            and args[0] in READ_ONLY_GIT
+            and not any(arg.startswith(GIT_UNSAFE_OPTIONS) for arg in args)
+        )
+    if program == "rg":
+        # --pre (and --pre-glob) pipe each file through an arbitrary command.
+        return not any(arg.startswith("--pre") for arg in args)
+    if program == "file":
+        # -C/--compile writes a compiled magic file; -C may be bundled (-bC).
+        return not any(
+            arg.startswith("--compile")
+            or (arg.startswith("-") and not arg.startswith("--") and "C" in arg)
+            for arg in args
+        )
+    return program in READ_ONLY_PROGRAMS
+
+
+def is_read_only(command: str) -> bool:
+    """
+    True if `command` is a plain pipeline of read-only programs: no
+    redirection, command lists, substitution or variables.
+    """
+    if any(c in command for c in "\n`$"):
+        return False
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return False
+
+    stages: list[list[str]] = [[]]
+    for token in tokens:
+        if token == "|":
+            stages.append([])
+        elif set(token) <= SHELL_OPERATOR_CHARS:
+            return False
+        else:
+            stages[-1].append(token)
+    return all(stage and _is_read_only_argv(stage) for stage in stages)
@@ -0,0 +1,112 @@
+# ai/_output.py
+
+"""
+Bounded capture of shell command output for the agents' ShellExecutor.
+"""
+
+import asyncio
+from collections import deque
+
+# ---------- CONFIG ----------
+
+# Only the tail of a command's output is kept; the agent needs the end of a
+# build log, not all of it.
+MAX_OUTPUT_LINES = 2000
+MAX_OUTPUT_BYTES = 4 * 1024 * 1024
+
+# Length of the tool-output preview printed to the console.
+PREVIEW_CHARS = 400
+
+# Below this, decoding inline is cheaper than a hop to a worker thread.
+DECODE_IN_THREAD_BYTES = 256 * 1024
+
+
+class TailBuffer:
+    """
+    Keeps the last MAX_OUTPUT_LINES lines (and at most MAX_OUTPUT_BYTES) of
+    a stream, dropping older output as new output arrives.
+
+    Output is held as the chunks it was read in, so a write is O(chunk)
+    rather than O(lines); the exact line cut happens once, in getvalue().
+    """
+
+    def __init__(
+        self,
+        max_lines: int = MAX_OUTPUT_LINES,
+        max_bytes: int = MAX_OUTPUT_BYTES,
+    ):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._chunks: deque[bytes] = deque()
+        self._newlines: deque[int] = deque()
+        self._size = 0
+        self._lines = 0
+        self._dropped_lines = 0
+        self._dropped_bytes = 0
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        count = data.count(b"\n")
+        self._chunks.append(data)
+        self._newlines.append(count)
+        self._size += len(data)
+        self._lines += count
+
+        # Drop whole chunks that are already outside the window.
+        while len(self._chunks) > 1 and (
+            self._lines - self._newlines[0] > self.max_lines
+            or self._size - len(self._chunks[0]) > self.max_bytes
+        ):
+            chunk = self._chunks.popleft()
+            self._size -= len(chunk)
+            self._dropped_bytes += len(chunk)
+            dropped = self._newlines.popleft()
+            self._lines -= dropped
+            self._dropped_lines += dropped
+
+    def getvalue(self) -> bytes:
+        data = b"".join(self._chunks)
+        dropped = self._dropped_lines
+
+        start = 0
+        for _ in range(self._lines - self.max_lines):
+            start = data.index(b"\n", start) + 1
+            dropped += 1
+        if len(data) - start > self.max_bytes:
+            cut = len(data) - self.max_bytes
+            line_end = data.find(b"\n", cut)
+            cut = line_end + 1 if line_end >= 0 else cut
+            dropped += data.count(b"\n", start, cut)
+            start = cut
+
+        if not dropped and not start and not self._dropped_bytes:
+            return data
+        if dropped:
+            note = f"…[{dropped} earlier lines truncated]…\n"
+        else:
+            # Only part of one long line went (no newline to cut at).
+            note = f"…[{self._dropped_bytes + start} earlier bytes truncated]…\n"
+        return note.encode() + data[start:]
+
+
+async def decode_output(data: bytes) -> str:
+    """
+    Decode captured output for the agent, off the event loop when it's
+    large enough to stall other work (streaming the model's reply, etc.).
+    """
+    if len(data) < DECODE_IN_THREAD_BYTES:
+        return data.decode("utf-8", errors="ignore")
+    return await asyncio.to_thread(data.decode, "utf-8", "ignore")
+
+
+def preview(obj, n: int = PREVIEW_CHARS) -> str:
+    """
+    First `n` characters of a tool output for the console log. Outputs are
+    already strings and only the preview is copied (a build log can be
+    megabytes).
+    """
+    text = obj[:n + 1] if isinstance(obj, str) else str(obj)[:n + 1]
+    if len(text) > n:
+        return text[:n] + "…"
+    return text
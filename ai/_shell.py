@@ -0,0 +1,475 @@
+# ai/_shell.py
+
+"""
+Shell tool shared by the dev and QA agents.
+"""
+
+import os
+import sys
+import asyncio
+import contextlib
+import shutil
+import signal
+from pathlib import Path
+from collections.abc import Sequence
+
+from agents import (
+    ShellTool,
+    ShellCommandRequest,
+    ShellCommandOutput,
+    ShellCallOutcome,
+    ShellResult,
+)
+
+from _commands import is_read_only, plain_argv
+from _output import TailBuffer, decode_output
+from _uring import URING_ENABLED, UringRunner
+
+# ---------- CONFIG ----------
+
+# Workspace = your repo root (levelup-platform)
+REPO_ROOT = Path(__file__).resolve().parents[1]
+WORKSPACE_DIR = REPO_ROOT  # you can change to a subfolder if needed
+
+# Set this to 1 if you want to auto-approve shell commands
+AUTO_APPROVE_ENV = "SHELL_AUTO_APPROVE"
+AUTO_APPROVE = os.environ.get(AUTO_APPROVE_ENV) == "1"
+
+
+# ---------- SHELL POOL ----------
+
+# Long-lived bash workers read NUL-terminated requests from stdin: an argv
+# count, then either that many argv fields or (count 0) a shell command.
+# Each command runs as its own background job: `set -m` gives it a process
+# group, so cd/exit/export inside it can't leak into the worker, SIGUSR1
+# kills just that job on timeout, and anything it left running in the
+# background is killed once it exits. A plain argv is run by the job
+# itself; a shell command costs another fork under eval. After every
+# command the worker prints a sentinel with the exit code on both stdout
+# and stderr.
+WORKER_SCRIPT = r"""
+cd -- "$1" || exit 1
+set -m
+exec 3>&2 2>/dev/null
+trap 'kill -KILL -- "-$job"; killed=1' USR1
+while IFS= read -r -d '' argc; do
+  killed=
+  if [ "$argc" -eq 0 ]; then
+    IFS= read -r -d '' cmd
+    eval "$cmd" </dev/null 2>&3 3>&- &
+  else
+    argv=()
+    while [ "${#argv[@]}" -lt "$argc" ]; do
+      IFS= read -r -d '' arg
+      argv+=("$arg")
+    done
+    "${argv[@]}" </dev/null 2>&3 3>&- &
+  fi
+  job=$!
+  wait "$job"
+  rc=$?
+  if [ -n "$killed" ]; then wait "$job"; rc=$?; fi
+  kill -KILL -- "-$job"
+  printf '\0__DONE__%d\0' "$rc"
+  printf '\0__DONE__%d\0' "$rc" >&3
+done
+"""
+WORKER_SHELL = os.path.abspath(shutil.which("bash") or "/bin/bash")
+DONE_MARKER = b"\0__DONE__"
+POOL_SIZE = 4
+# How long a dropped worker gets to kill its running job before it's killed.
+KILL_GRACE = 1.0
+READ_CHUNK = 64 * 1024
+
+
+def _encode_request(command: str) -> bytes:
+    argv = plain_argv(command)
+    fields = [str(len(argv)), *argv] if argv else ["0", command]
+    return b"".join(field.encode("utf-8") + b"\0" for field in fields)
+
+
+async def _read_until_done(stream: asyncio.StreamReader, sink: TailBuffer) -> int | None:
+    """
+    Stream one command's output from a worker pipe into `sink`, up to the
+    sentinel. Returns the exit code, or None if the worker died first.
+    """
+    pending = b""
+    keep = len(DONE_MARKER) - 1  # a marker may straddle two reads
+    while True:
+        chunk = await stream.read(READ_CHUNK)
+        if not chunk:
+            sink.write(pending)
+            return None
+        pending += chunk
+
+        start = pending.find(DONE_MARKER)
+        if start < 0:
+            if len(pending) > keep:
+                sink.write(pending[:-keep])
+                pending = pending[-keep:]
+            continue
+
+        sink.write(pending[:start])
+        pending = pending[start + len(DONE_MARKER):]
+        while (end := pending.find(b"\0")) < 0:
+            chunk = await stream.read(READ_CHUNK)
+            if not chunk:
+                return None
+            pending += chunk
+        return int(pending[:end])
+
+
+class _Worker:
+    """
+    One pool worker, with a reader task per output pipe for its whole life
+    rather than a fresh pair per command. A command hands each reader a
+    (sink, future); the reader fills the sink up to the sentinel and
+    resolves the future with the exit code (None if the worker died).
+    """
+
+    def __init__(self, proc: asyncio.subprocess.Process):
+        self.proc = proc
+        self._jobs = (asyncio.Queue(), asyncio.Queue())
+        self._readers = [
+            asyncio.ensure_future(self._pump(stream, jobs))
+            for stream, jobs in zip((proc.stdout, proc.stderr), self._jobs)
+        ]
+
+    @staticmethod
+    async def _pump(stream: asyncio.StreamReader, jobs: asyncio.Queue) -> None:
+        while True:
+            sink, result = await jobs.get()
+            try:
+                exit_code = await _read_until_done(stream, sink)
+            except Exception as exc:
+                if not result.done():
+                    result.set_exception(exc)
+                return
+            if not result.done():
+                result.set_result(exit_code)
+            if exit_code is None:
+                return
+
+    def expect(self, stdout: TailBuffer, stderr: TailBuffer) -> list[asyncio.Future]:
+        """Queue sinks for the next command; returns its two exit-code futures."""
+        loop = asyncio.get_running_loop()
+        results = [loop.create_future(), loop.create_future()]
+        for jobs, sink, result in zip(self._jobs, (stdout, stderr), results):
+            jobs.put_nowait((sink, result))
+        return results
+
+    def alive(self) -> bool:
+        # WNOWAIT: check without reaping it out from under the child watcher.
+        if self.proc.returncode is not None:
+            return False
+        flags = os.WEXITED | os.WNOHANG | os.WNOWAIT
+        with contextlib.suppress(ChildProcessError):
+            return os.waitid(os.P_PID, self.proc.pid, flags) is None
+        return False
+
+    async def kill(self, reads: Sequence[asyncio.Future] = ()) -> None:
+        """
+        Stop the running command, then the worker. The command's job has
+        its own process group, so killing the worker alone would orphan
+        it; the USR1 trap kills that group first and then prints the
+        sentinel that `reads` are waiting for.
+        """
+        if self.alive():
+            with contextlib.suppress(ProcessLookupError):
+                self.proc.send_signal(signal.SIGUSR1)
+                if reads:
+                    await asyncio.wait(reads, timeout=KILL_GRACE)
+                self.proc.kill()
+        for reader in self._readers:
+            reader.cancel()
+
+    async def close(self) -> None:
+        if self.proc.returncode is None:
+            self.proc.stdin.close()
+            await self.proc.wait()
+        for reader in self._readers:
+            reader.cancel()
+
+
+class _ShellPool:
+    """
+    Prewarmed bash workers, so running a command is a write to a live shell
+    instead of a fresh fork + exec of /bin/sh for every call.
+    """
+
+    def __init__(self, cwd: Path, size: int = POOL_SIZE):
+        self.cwd = cwd
+        self.size = size
+        self._cwd_str = str(cwd)
+        self._idle: asyncio.Queue | None = None
+
+    async def _spawn(self) -> _Worker:
+        # An absolute WORKER_SHELL, no cwd= (the script cds itself) and
+        # close_fds=False let subprocess use os.posix_spawn instead of
+        # fork_exec. Our own fds are non-inheritable (PEP 446), so nothing
+        # leaks into the worker.
+        proc = await asyncio.create_subprocess_exec(
+            WORKER_SHELL,
+            "-c",
+            WORKER_SCRIPT,
+            "bash",
+            self._cwd_str,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            close_fds=False,
+        )
+        return _Worker(proc)
+
+    async def start(self) -> None:
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+
+    async def run(
+        self, command: str, timeout: float | None
+    ) -> tuple[bytes, bytes, int | None, bool]:
+        """
+        Run one command on an idle worker.
+
+        Returns (stdout, stderr, exit_code, timed_out).
+        """
+        await self.start()
+        worker = await self._idle.get()
+        if worker is not None and not worker.alive():
+            await worker.kill()  # died while idle
+            worker = None
+
+        healthy = False
+        reads: list[asyncio.Future] = []
+        try:
+            request = _encode_request(command)
+            try:
+                worker = worker or await self._spawn()
+                worker.proc.stdin.write(request)
+                await worker.proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Died while idle, before its exit was noticed.
+                await worker.kill()
+                worker = await self._spawn()
+                worker.proc.stdin.write(request)
+                await worker.proc.stdin.drain()
+
+            stdout, stderr = TailBuffer(), TailBuffer()
+            reads = worker.expect(stdout, stderr)
+            _, pending = await asyncio.wait(reads, timeout=timeout)
+            timed_out = bool(pending)
+            if timed_out:
+                worker.proc.send_signal(signal.SIGUSR1)
+            # Not gather: if we're cancelled here, kill() below still needs
+            # the futures uncancelled to see the job go.
+            await asyncio.wait(reads)
+            exit_code, _ = [read.result() for read in reads]
+
+            healthy = exit_code is not None
+            if timed_out and exit_code == 128 + signal.SIGKILL:
+                # bash's code for a SIGKILLed job; report it the way
+                # subprocess (and the uring path) do.
+                exit_code = -signal.SIGKILL
+            return stdout.getvalue(), stderr.getvalue(), exit_code, timed_out
+        finally:
+            self._idle.put_nowait(worker if healthy else None)
+            if not healthy and worker is not None:
+                # Don't leave the command running, then drop the worker.
+                await worker.kill(reads)
+
+    async def close(self) -> None:
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is not None:
+                await worker.close()
+        self._idle = None
+
+
+# ---------- SHELL EXECUTOR ----------
+
+def use_pidfd_child_watcher() -> None:
+    """
+    Have the running loop reap subprocesses through pidfds (epoll wakes it
+    when a child exits) instead of Python 3.11's default of a waitpid
+    thread per child. 3.12+ already does this on its own.
+    """
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:  # kernel < 5.3, or pidfd_open is blocked
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(asyncio.get_running_loop())
+    asyncio.set_child_watcher(watcher)
+
+
+async def _run_all(coros) -> list:
+    """
+    Like asyncio.gather, but cancels the rest as soon as one fails (or the
+    caller is cancelled) instead of leaving them running.
+    """
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+# What _read_line read from stdin past the line it returned (piped input
+# can deliver several answers in one read).
+_stdin_pending = bytearray()
+
+
+async def _read_line(prompt: str) -> str:
+    """
+    input(), but waiting for stdin on the event loop itself so the loop
+    keeps going. (A thread parked in input() would hold up shutdown on
+    Ctrl-C until Enter is pressed.)
+    """
+    print(prompt, end="", flush=True)
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    while b"\n" not in _stdin_pending:
+        readable = loop.create_future()
+        try:
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        except PermissionError:  # a regular file; reading it won't block
+            pass
+        else:
+            try:
+                await readable
+            finally:
+                loop.remove_reader(fd)
+        chunk = os.read(fd, 1024)
+        if not chunk:
+            break
+        _stdin_pending.extend(chunk)
+    if not _stdin_pending:
+        raise EOFError("EOF when reading a line")
+    end = _stdin_pending.find(b"\n") + 1 or len(_stdin_pending)
+    line = bytes(_stdin_pending[:end])
+    del _stdin_pending[:end]
+    return line.decode("utf-8", errors="replace").rstrip("\n")
+
+
+async def _ask_approval(commands: Sequence[str], label: str = "") -> None:
+    """
+    Ask for confirmation before running shell commands.
+
+    Set SHELL_AUTO_APPROVE=1 in your environment to skip this prompt.
+    """
+    print(f"\n{label}Shell command approval required:")
+    for c in commands:
+        print("  ", c)
+    resp = (await _read_line("Proceed? [y/N] ")).strip().lower()
+    if resp not in {"y", "yes"}:
+        raise RuntimeError("Shell command execution rejected by user.")
+
+
+async def _auto_approve(commands: Sequence[str], label: str = "") -> None:
+    return
+
+
+# Chosen once at import; the env var is read when the agent starts.
+require_approval = _auto_approve if AUTO_APPROVE else _ask_approval
+
+
+class ShellExecutor:
+    """
+    Runs all commands inside WORKSPACE_DIR, captures stdout/stderr,
+    and respects optional timeouts.
+    """
+
+    def __init__(self, cwd: Path, label: str = ""):
+        self.cwd = cwd
+        self.label = label
+        self._cwd_str = str(cwd)
+        self.pool = _ShellPool(cwd)
+        self.uring: UringRunner | None = None
+
+    async def start(self) -> None:
+        if not URING_ENABLED:
+            await self.pool.start()
+        elif self.uring is None:
+            self.uring = UringRunner()
+
+    async def aclose(self) -> None:
+        await self.pool.close()
+        if self.uring is not None:
+            await self.uring.close()
+            self.uring = None
+
+    async def _output(
+        self,
+        command: str,
+        stdout_bytes: bytes,
+        stderr_bytes: bytes,
+        exit_code: int | None,
+        timed_out: bool,
+    ) -> ShellCommandOutput:
+        return ShellCommandOutput(
+            command=command,
+            stdout=await decode_output(stdout_bytes),
+            stderr=await decode_output(stderr_bytes),
+            outcome=ShellCallOutcome(
+                type="timeout" if timed_out else "exit",
+                exit_code=exit_code,
+            ),
+        )
+
+    async def _run_one(self, command: str, timeout: float | None) -> ShellCommandOutput:
+        return await self._output(command, *await self.pool.run(command, timeout))
+
+    async def __call__(self, request: ShellCommandRequest) -> ShellResult:
+        action = request.data.action
+        await require_approval(action.commands, self.label)
+
+        commands = action.commands
+        timeout = (action.timeout_ms or 0) / 1000 or None
+        parallel = len(commands) > 1 and all(map(is_read_only, commands))
+
+        outputs: list[ShellCommandOutput] = []
+
+        if URING_ENABLED:
+            await self.start()
+            results = await self.uring.run_batch(
+                commands, self._cwd_str, action.timeout_ms, parallel
+            )
+            for result in results:
+                outputs.append(await self._output(*result))
+        elif parallel:
+            # The pool's idle queue caps how many of these run at once.
+            outputs = await _run_all(self._run_one(c, timeout) for c in commands)
+        else:
+            for command in commands:
+                output = await self._run_one(command, timeout)
+                outputs.append(output)
+                if output.outcome.type == "timeout":
+                    break
+
+        return ShellResult(
+            output=outputs,
+            provider_data={"working_directory": self._cwd_str},
+        )
+
+
+def build_shell_tool(cwd: Path, label: str = "") -> ShellTool:
+    """
+    Shell tool whose executor runs commands in `cwd`. `label` prefixes the
+    approval prompt so you can tell which agent is asking.
+    """
+    return ShellTool(executor=ShellExecutor(cwd=cwd, label=label))
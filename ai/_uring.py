@@ -0,0 +1,460 @@
+# ai/_uring.py
+
+"""
+Optional io_uring backend for the agents' ShellExecutor.
+
+Enabled with SHELL_USE_URING=1 on Linux >= 5.6 when the `liburing` package
+(pip install liburing) is available and a ring can actually be set up.
+Otherwise the executors keep using asyncio subprocesses and nothing in
+here is touched.
+
+SHELL_URING_SQPOLL=1 additionally submits through an SQ polling thread.
+"""
+
+import asyncio
+import contextlib
+import errno
+import os
+import signal
+from collections.abc import Sequence
+
+from _commands import plain_argv
+from _output import TailBuffer
+
+try:
+    import liburing
+except ImportError:  # optional dependency
+    liburing = None
+
+# ---------- CONFIG ----------
+
+USE_URING_ENV = "SHELL_USE_URING"
+
+# Opt-in: a kernel thread polls the SQ, so submits don't need a syscall.
+SQPOLL_ENV = "SHELL_URING_SQPOLL"
+
+# Without WAITID, how often a command that closed its pipes but is still
+# running gets checked against the deadline.
+EXIT_POLL_SECONDS = 0.01
+
+# Size of each read buffer.
+READ_CHUNK = 64 * 1024
+
+# Most commands run side by side; the fixed-file table and the buffers are
+# sized for this many once, and bigger parallel batches go in waves.
+MAX_WAVE = 8
+
+# With multishot reads the pipes share one group of provided buffers, a few
+# per pipe so a chatty command doesn't stall waiting for one to come back.
+BUFFER_GROUP = 0
+BUFFERS_PER_PIPE = 2
+
+# user_data tags; pipe reads use their slot number (a small int).
+PROVIDE_TAG = 1 << 63
+WAIT_TAG = 1 << 62  # | command index
+TIMEOUT_TAG = 1 << 61
+
+# Commands run under `sh -c` after a cd into the workspace (posix_spawn has
+# no cwd). A plain argv is exec'ed in place of that shell; anything else is
+# eval'ed by it.
+SHELL_ARGV = ["/bin/sh", "-c", 'cd -- "$1" || exit; eval "$2"', "sh"]
+EXEC_ARGV = ["/bin/sh", "-c", 'cd -- "$1" || exit; shift; exec "$@"', "sh"]
+
+
+def _kernel_at_least(major: int, minor: int) -> bool:
+    release = os.uname().release.split("-", 1)[0].split(".")
+    try:
+        return (int(release[0]), int(release[1])) >= (major, minor)
+    except (IndexError, ValueError):
+        return False
+
+
+def _ring_available() -> bool:
+    """
+    Whether a ring can be set up at all here; seccomp (Docker's default
+    profile) or kernel.io_uring_disabled can refuse it on any kernel.
+    """
+    ring = liburing.Ring()
+    try:
+        liburing.io_uring_queue_init(8, ring)
+    except OSError:
+        return False
+    liburing.io_uring_queue_exit(ring)
+    return True
+
+
+URING_ENABLED = (
+    liburing is not None
+    and os.environ.get(USE_URING_ENV) == "1"
+    and _kernel_at_least(5, 6)
+    and _ring_available()
+)
+
+# IORING_RSRC_REGISTER_SPARSE (Linux 5.19+); before that an empty file
+# table is registered as -1 entries.
+SPARSE_FILES = URING_ENABLED and _kernel_at_least(5, 19)
+
+SQPOLL = URING_ENABLED and os.environ.get(SQPOLL_ENV) == "1"
+
+# io_uring opcodes this kernel supports, by name.
+_OPS = (liburing.probe() or {}) if URING_ENABLED else {}
+
+# One multishot read per pipe instead of a read_fixed per chunk (Linux 6.7+).
+READ_MULTISHOT = bool(_OPS.get("IORING_OP_READ_MULTISHOT"))
+
+# Exit and timeout of each command are watched in the ring: a waitid linked
+# to a link_timeout (Linux 6.7+).
+WAITID = bool(_OPS.get("IORING_OP_WAITID"))
+
+
+# ---------- BATCH RUNNER ----------
+
+def _spawn(command: str, cwd: str) -> tuple[int, int, int]:
+    """
+    posix_spawn `command` in its own session (so a timeout can kill the
+    whole process group). Returns (pid, stdout_fd, stderr_fd).
+
+    Python ignores SIGPIPE/SIGXFSZ and a spawned child would inherit that,
+    so they're reset to default like subprocess does; otherwise
+    `seq 1 1000000 | head -1` ends in "write error: Broken pipe".
+    """
+    argv = plain_argv(command)
+    if argv:
+        argv = EXEC_ARGV + [cwd, *argv]
+    else:
+        argv = SHELL_ARGV + [cwd, command]
+
+    out_r, out_w = os.pipe2(os.O_CLOEXEC)
+    err_r, err_w = os.pipe2(os.O_CLOEXEC)
+    try:
+        pid = os.posix_spawn(
+            argv[0],
+            argv,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+                (os.POSIX_SPAWN_DUP2, out_w, 1),
+                (os.POSIX_SPAWN_DUP2, err_w, 2),
+            ],
+            setsid=True,
+            setsigdef=(signal.SIGPIPE, signal.SIGXFSZ),
+        )
+    except BaseException:
+        os.close(out_r)
+        os.close(err_r)
+        raise
+    finally:
+        os.close(out_w)
+        os.close(err_w)
+    return pid, out_r, err_r
+
+
+def _kill(pid: int) -> None:
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(pid, signal.SIGKILL)
+
+
+def _exited(pid: int) -> bool:
+    """Whether `pid` has exited, without reaping it."""
+    return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+
+
+def _init_ring(entries: int):
+    """
+    Set up a ring, with an SQ polling thread when SQPOLL is on. Kernels
+    before 5.11 only allow that with CAP_SYS_NICE; without it the ring
+    falls back to plain io_uring_enter submits.
+    """
+    ring = liburing.Ring()
+    if SQPOLL:
+        try:
+            liburing.io_uring_queue_init(entries, ring, liburing.IORING_SETUP_SQPOLL)
+            return ring
+        except PermissionError:
+            pass
+    liburing.io_uring_queue_init(entries, ring)
+    return ring
+
+
+def _provide(ring, buffers: list[bytearray], bid: int) -> None:
+    """Hand buffer `bid` (back) to the multishot buffer group."""
+    sqe = liburing.io_uring_get_sqe(ring)
+    liburing.io_uring_prep_provide_buffers(sqe, buffers[bid], 1, BUFFER_GROUP, bid)
+    liburing.io_uring_sqe_set_flags(sqe, liburing.IOSQE_CQE_SKIP_SUCCESS)
+    liburing.io_uring_sqe_set_data64(sqe, PROVIDE_TAG)
+
+
+async def _run_wave(
+    ring,
+    eventfd: int,
+    buffers: list[bytearray],
+    commands: Sequence[str],
+    cwd: str,
+    timeout_ms: int | None,
+) -> list[tuple[str, bytes, bytes, int | None, bool]]:
+    """
+    Run `commands` side by side on `ring`. Command k reads through fixed
+    file slots 2k (stdout) and 2k + 1 (stderr).
+
+    With READ_MULTISHOT each pipe gets a single read that keeps posting a
+    CQE per chunk into whichever provided buffer the kernel picked, and
+    the buffer is handed back once its data is copied out. Otherwise each
+    pipe reads into its own registered buffer and is re-armed per chunk.
+
+    With WAITID each command also gets a waitid (WNOWAIT, so the status is
+    still there for waitpid below) linked to a link_timeout: the kernel
+    cancels the wait when the timeout expires, and that cancellation is
+    what kills the command. Once a command exits, whatever it left running
+    in its process group is killed too, as the pool workers do. Without
+    WAITID the timeout is a deadline on waiting for the CQ, and then on
+    polling for the exit of commands that closed their pipes early.
+
+    Nothing here blocks in liburing: the ring signals `eventfd` whenever
+    it posts a CQE, the event loop watches that, and the CQ is drained
+    with io_uring_peek_cqe. If the wave is cancelled its process groups
+    are killed.
+    """
+    loop = asyncio.get_running_loop()
+    posted = asyncio.Event()
+    loop.add_reader(eventfd, posted.set)
+    cqe = liburing.Cqe()
+    siginfo = liburing.SigsetT() if WAITID else None  # not read; see WNOWAIT
+    timeout = liburing.timespec(timeout_ms / 1000) if timeout_ms else None
+
+    def prep_read(slot: int) -> None:
+        sqe = liburing.io_uring_get_sqe(ring)
+        if READ_MULTISHOT:
+            liburing.io_uring_prep_read_multishot(sqe, slot, BUFFER_GROUP)
+            flags = liburing.IOSQE_FIXED_FILE | liburing.IOSQE_BUFFER_SELECT
+        else:
+            liburing.io_uring_prep_read_fixed(sqe, slot, buffers[slot], slot)
+            flags = liburing.IOSQE_FIXED_FILE
+        liburing.io_uring_sqe_set_flags(sqe, flags)
+        liburing.io_uring_sqe_set_data64(sqe, slot)
+
+    def prep_wait(k: int, linked_timeout) -> None:
+        sqe = liburing.io_uring_get_sqe(ring)
+        liburing.io_uring_prep_waitid(
+            sqe, os.P_PID, procs[k][0], siginfo, os.WEXITED | os.WNOWAIT
+        )
+        liburing.io_uring_sqe_set_data64(sqe, WAIT_TAG | k)
+        if linked_timeout is not None:
+            liburing.io_uring_sqe_set_flags(sqe, liburing.IOSQE_IO_LINK)
+            sqe = liburing.io_uring_get_sqe(ring)
+            liburing.io_uring_prep_link_timeout(sqe, linked_timeout, 0)
+            liburing.io_uring_sqe_set_data64(sqe, TIMEOUT_TAG)
+
+    procs: list[tuple[int, int, int]] = []
+    sinks = [TailBuffer() for _ in range(2 * len(commands))]
+    open_pipes = [2] * len(commands)
+    running = [WAITID] * len(commands)
+    timed_out = [False] * len(commands)
+    statuses = []
+    try:
+        for command in commands:
+            procs.append(_spawn(command, cwd))
+
+        fds = [fd for _, out_r, err_r in procs for fd in (out_r, err_r)]
+        liburing.io_uring_register_files_update(ring, liburing.FileIndex(fds), 0)
+        for slot in range(len(fds)):
+            prep_read(slot)
+        if WAITID:
+            for k in range(len(procs)):
+                prep_wait(k, timeout)
+        liburing.io_uring_submit(ring)
+
+        deadline = None
+        if timeout_ms and not WAITID:
+            deadline = loop.time() + timeout_ms / 1000
+        while any(open_pipes) or any(running):
+            try:
+                liburing.io_uring_peek_cqe(ring, cqe)
+            except BlockingIOError:  # CQ is empty
+                remaining = None if deadline is None else max(deadline - loop.time(), 0)
+                try:
+                    await asyncio.wait_for(posted.wait(), remaining)
+                except TimeoutError:
+                    for k, (pid, _, _) in enumerate(procs):
+                        if open_pipes[k] or not _exited(pid):
+                            _kill(pid)
+                            timed_out[k] = True
+                    deadline = None
+                    continue
+                # Reset before peeking again, so a CQE posted from here on
+                # signals the eventfd anew.
+                posted.clear()
+                with contextlib.suppress(BlockingIOError):
+                    os.eventfd_read(eventfd)
+                continue
+
+            entry = cqe[0]
+            slot = liburing.io_uring_cqe_get_data64(entry)
+            flags = entry.flags
+            try:
+                res = entry.res
+            except OSError as exc:  # the binding raises on a negative res
+                res = -exc.errno
+            liburing.io_uring_cqe_seen(ring, entry)
+
+            if slot == PROVIDE_TAG:
+                raise OSError(-res, os.strerror(-res))
+            if slot == TIMEOUT_TAG:
+                continue
+            if slot & WAIT_TAG:
+                k = slot ^ WAIT_TAG
+                _kill(procs[k][0])
+                if res == -errno.ECANCELED:  # the linked timeout fired
+                    timed_out[k] = True
+                    prep_wait(k, None)
+                    liburing.io_uring_submit(ring)
+                else:
+                    running[k] = False
+                continue
+
+            if res > 0:
+                if READ_MULTISHOT:
+                    bid = flags >> liburing.IORING_CQE_BUFFER_SHIFT
+                    sinks[slot].write(bytes(buffers[bid][:res]))
+                    _provide(ring, buffers, bid)
+                else:
+                    sinks[slot].write(bytes(buffers[slot][:res]))
+
+            # A multishot read ends on EOF, an error, or when it ran out of
+            # buffers (then it's re-armed once they've been handed back).
+            if res == -errno.ENOBUFS or (res > 0 and not flags & liburing.IORING_CQE_F_MORE):
+                prep_read(slot)
+            elif res <= 0:
+                open_pipes[slot // 2] -= 1
+            liburing.io_uring_submit(ring)
+
+        # The pipes are drained, but a command may have detached them and
+        # still be running; don't let waitpid below block the loop on it or
+        # outlast the deadline.
+        for k, (pid, _, _) in enumerate(procs):
+            while not timed_out[k] and not _exited(pid):
+                if deadline is not None and loop.time() >= deadline:
+                    _kill(pid)
+                    timed_out[k] = True
+                else:
+                    await asyncio.sleep(EXIT_POLL_SECONDS)
+    except BaseException:
+        for pid, _, _ in procs:
+            _kill(pid)
+        raise
+    finally:
+        loop.remove_reader(eventfd)
+        for pid, out_r, err_r in procs:
+            os.close(out_r)
+            os.close(err_r)
+            statuses.append(os.waitpid(pid, 0)[1])
+
+    return [
+        (
+            command,
+            sinks[2 * k].getvalue(),
+            sinks[2 * k + 1].getvalue(),
+            os.waitstatus_to_exitcode(statuses[k]),
+            timed_out[k],
+        )
+        for k, command in enumerate(commands)
+    ]
+
+
+class UringRunner:
+    """
+    A ring, its fixed-file table and its read buffers, set up once and
+    reused for every batch an executor runs.
+
+    Each command is spawned with posix_spawn; its stdout/stderr pipes are
+    registered as fixed files and drained with multishot reads into
+    provided buffers (read_fixed into registered buffers on kernels without
+    READ_MULTISHOT), its exit and timeout come from a linked
+    waitid/link_timeout pair, and the whole batch is reaped from one CQ.
+
+    The ring posts completions to an eventfd the event loop watches, so a
+    batch runs on the loop without blocking it.
+
+    Batches are serialized on the ring. If one fails or is cancelled midway
+    the ring is torn down (reads may still be in flight) and set up again
+    on the next.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._ring = None
+        self._eventfd = -1
+        self._buffers: list[bytearray] = []
+
+    def _setup(self) -> None:
+        per_pipe = BUFFERS_PER_PIPE if READ_MULTISHOT else 1
+        ring = _init_ring(2 * MAX_WAVE * (per_pipe + 2))
+        buffers = [bytearray(READ_CHUNK) for _ in range(2 * MAX_WAVE * per_pipe)]
+        eventfd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        try:
+            liburing.io_uring_register_eventfd(ring, eventfd)
+            if READ_MULTISHOT:
+                for bid in range(len(buffers)):
+                    _provide(ring, buffers, bid)
+                liburing.io_uring_submit(ring)
+            else:
+                liburing.io_uring_register_buffers(ring, liburing.Iovec(buffers))
+            if SPARSE_FILES:
+                liburing.io_uring_register_files_sparse(ring, 2 * MAX_WAVE)
+            else:
+                liburing.io_uring_register_files(
+                    ring, liburing.FileIndex([-1] * (2 * MAX_WAVE))
+                )
+        except BaseException:
+            liburing.io_uring_queue_exit(ring)
+            os.close(eventfd)
+            raise
+        self._ring, self._eventfd, self._buffers = ring, eventfd, buffers
+
+    def _teardown(self) -> None:
+        if self._ring is not None:
+            liburing.io_uring_queue_exit(self._ring)
+            os.close(self._eventfd)
+        self._ring, self._eventfd, self._buffers = None, -1, []
+
+    async def run_batch(
+        self,
+        commands: Sequence[str],
+        cwd: str,
+        timeout_ms: int | None,
+        parallel: bool = False,
+    ) -> list[tuple[str, bytes, bytes, int | None, bool]]:
+        """
+        Run `commands` and return (command, stdout, stderr, exit_code,
+        timed_out) for each one.
+
+        By default commands run one at a time, because the agent relies on
+        ordering (write a file, then lint it), and like the asyncio path
+        the batch stops after the first timeout. With `parallel=True`
+        (independent, read-only commands) they run MAX_WAVE at a time and
+        every pipe read of a wave goes out in a single submit.
+        """
+        width = MAX_WAVE if parallel else 1
+        results = []
+        async with self._lock:
+            if self._ring is None:
+                self._setup()
+            try:
+                for start in range(0, len(commands), width):
+                    wave = commands[start:start + width]
+                    results.extend(await _run_wave(
+                        self._ring, self._eventfd, self._buffers, wave, cwd, timeout_ms
+                    ))
+                    # Drop the table's references to the finished pipes.
+                    liburing.io_uring_register_files_update(
+                        self._ring, liburing.FileIndex([-1] * (2 * len(wave))), 0
+                    )
+                    if any(timed_out for *_, timed_out in results):
+                        break
+            except BaseException:
+                self._teardown()
+                raise
+        return results
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._teardown()
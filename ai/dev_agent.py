@@ -3,115 +3,25 @@
 import os
 import sys
 import asyncio
-from pathlib import Path
-from collections.abc import Sequence
-from typing import Literal
+import hashlib
 
 from agents import (
     Agent,
+    ModelSettings,
     Runner,
     ItemHelpers,
-    ShellTool,
-    ShellCommandRequest,
-    ShellCommandOutput,
-    ShellCallOutcome,
-    ShellResult,
     WebSearchTool,
 )
 
-# ---------- CONFIG ----------
+from _output import preview
+from _shell import WORKSPACE_DIR, build_shell_tool, use_pidfd_child_watcher
 
-# Workspace = your repo root (levelup-platform)
-REPO_ROOT = Path(__file__).resolve().parents[1]
-WORKSPACE_DIR = REPO_ROOT  # you can change to a subfolder if needed
+# ---------- SHELL TOOL ----------
 
-# Set this to 1 if you want to auto-approve shell commands
-AUTO_APPROVE_ENV = "SHELL_AUTO_APPROVE"
+shell_tool = build_shell_tool(WORKSPACE_DIR)
+shell_executor = shell_tool.executor
 
 
-# ---------- SHELL EXECUTOR ----------
-
-async def require_approval(commands: Sequence[str]) -> None:
-    """
-    Ask for confirmation before running shell commands.
-
-    Set SHELL_AUTO_APPROVE=1 in your environment to skip this prompt.
-    """
-    if os.environ.get(AUTO_APPROVE_ENV) == "1":
-        return
-
-    print("\nShell command approval required:")
-    for c in commands:
-        print("  ", c)
-    resp = input("Proceed? [y/N] ").strip().lower()
-    if resp not in {"y", "yes"}:
-        raise RuntimeError("Shell command execution rejected by user.")
-
-
-class ShellExecutor:
-    """
-    Runs all commands inside WORKSPACE_DIR, captures stdout/stderr,
-    and respects optional timeouts.
-    """
-
-    def __init__(self, cwd: Path):
-        self.cwd = cwd
-
-    async def __call__(self, request: ShellCommandRequest) -> ShellResult:
-        action = request.data.action
-        await require_approval(action.commands)
-
-        outputs: list[ShellCommandOutput] = []
-
-        for command in action.commands:
-            proc = await asyncio.create_subprocess_shell(
-                command,
-                cwd=self.cwd,
-                env=os.environ.copy(),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
-
-            timed_out = False
-            try:
-                timeout = (action.timeout_ms or 0) / 1000 or None
-                stdout_bytes, stderr_bytes = await asyncio.wait_for(
-                    proc.communicate(),
-                    timeout=timeout,
-                )
-            except asyncio.TimeoutError:
-                proc.kill()
-                stdout_bytes, stderr_bytes = await proc.communicate()
-                timed_out = True
-
-            stdout = stdout_bytes.decode("utf-8", errors="ignore")
-            stderr = stderr_bytes.decode("utf-8", errors="ignore")
-
-            outcome = ShellCallOutcome(
-                type="timeout" if timed_out else "exit",
-                exit_code=getattr(proc, "returncode", None),
-            )
-
-            outputs.append(
-                ShellCommandOutput(
-                    command=command,
-                    stdout=stdout,
-                    stderr=stderr,
-                    outcome=outcome,
-                )
-            )
-
-            if timed_out:
-                break
-
-        return ShellResult(
-            output=outputs,
-            provider_data={"working_directory": str(self.cwd)},
-        )
-
-
-shell_tool = ShellTool(executor=ShellExecutor(cwd=WORKSPACE_DIR))
-
 # ---------- AGENT DEFINITION ----------
 
 INSTRUCTIONS = """
@@ -147,10 +57,17 @@ Communication:
 - If something is ambiguous, explain the tradeoffs in your assistant messages.
 """
 
+# A stable prompt_cache_key, derived from the instructions, lets every run
+# (not just the turns of one) hit the cached prompt prefix; the SDK would
+# otherwise generate a fresh key per run.
+INSTRUCTIONS_SHA256 = hashlib.sha256(INSTRUCTIONS.encode("utf-8")).hexdigest()
+PROMPT_CACHE_KEY = f"levelup-dev-{INSTRUCTIONS_SHA256[:32]}"
+
 dev_agent = Agent(
     name="LevelUp Dev Agent",
     model="gpt-5.1",
     instructions=INSTRUCTIONS,
+    model_settings=ModelSettings(extra_args={"prompt_cache_key": PROMPT_CACHE_KEY}),
     tools=[
         WebSearchTool(),   # lets it look up docs / errors
         shell_tool,        # lets it run commands in your repo
@@ -160,45 +77,72 @@ dev_agent = Agent(
 
 # ---------- RUNNER WITH LOGGING ----------
 
+# Raw tool-call classes worth a specific log line, by class name.
+_RAW_KIND = {
+    "ResponseFunctionWebSearch": "web",
+    "LocalShellCall": "shell",
+    "ShellCall": "shell",
+}
+
+
+def _on_tool_call(item) -> None:
+    raw = item.raw_item
+    raw_type_name = type(raw).__name__
+    kind = _RAW_KIND.get(raw_type_name)
+
+    if kind == "web":
+        print("[tool] web_search – agent is querying the web")
+    elif kind == "shell":
+        action = getattr(raw, "action", None)
+        commands = getattr(action, "commands", None)
+        if commands:
+            print(f"[tool] shell – wants to run: {commands}")
+        else:
+            print("[tool] shell – wants to run a command")
+    else:
+        print(f"[tool] {raw_type_name} called")
+
+
+def _on_tool_output(item) -> None:
+    out_preview = preview(item.output)
+    print(f"[tool output]\n{out_preview}\n")
+
+
+def _on_message(item) -> None:
+    text = ItemHelpers.text_message_output(item)
+    if text.strip():
+        print(f"[assistant]\n{text}\n")
+
+
+_ITEM_HANDLERS = {
+    "tool_call_item": _on_tool_call,
+    "tool_call_output_item": _on_tool_output,
+    "message_output_item": _on_message,
+}
+
+
 async def run_dev_agent(task: str):
     print("=== LevelUp Dev Agent Run ===")
     print(f"[user task] {task}")
     print(f"Workspace: {WORKSPACE_DIR}\n")
 
+    use_pidfd_child_watcher()
+
+    # Warm the shell workers while the first model turn is in flight.
+    warmup = asyncio.ensure_future(shell_executor.start())
     result = Runner.run_streamed(dev_agent, input=task)
 
-    async for event in result.stream_events():
-        if event.type != "run_item_stream_event":
-            continue
-
-        item = event.item
-
-        if item.type == "tool_call_item":
-            raw = item.raw_item
-            raw_type_name = type(raw).__name__
-
-            if raw_type_name == "ResponseFunctionWebSearch":
-                print("[tool] web_search – agent is querying the web")
-            elif raw_type_name == "LocalShellCall" or raw_type_name == "ShellCall":
-                action = getattr(raw, "action", None)
-                commands = getattr(action, "commands", None)
-                if commands:
-                    print(f"[tool] shell – wants to run: {commands}")
-                else:
-                    print("[tool] shell – wants to run a command")
-            else:
-                print(f"[tool] {raw_type_name} called")
-
-        elif item.type == "tool_call_output_item":
-            out_preview = str(item.output)
-            if len(out_preview) > 400:
-                out_preview = out_preview[:400] + "…"
-            print(f"[tool output]\n{out_preview}\n")
-
-        elif item.type == "message_output_item":
-            text = ItemHelpers.text_message_output(item)
-            if text.strip():
-                print(f"[assistant]\n{text}\n")
+    try:
+        async for event in result.stream_events():
+            if event.type != "run_item_stream_event":
+                continue
+
+            handler = _ITEM_HANDLERS.get(event.item.type)
+            if handler:
+                handler(event.item)
+    finally:
+        await warmup
+        await shell_executor.aclose()
 
     print("=== Run complete ===\n")
     print("Final summary:\n")
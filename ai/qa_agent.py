@@ -3,96 +3,24 @@
 import os
 import sys
 import asyncio
-from pathlib import Path
+import hashlib
 
 from agents import (
     Agent,
+    ModelSettings,
     Runner,
     ItemHelpers,
-    ShellTool,
-    ShellCommandRequest,
-    ShellCommandOutput,
-    ShellCallOutcome,
-    ShellResult,
 )
 
-# ---------- CONFIG ----------
+from _output import preview
+from _shell import WORKSPACE_DIR, build_shell_tool, use_pidfd_child_watcher
 
-REPO_ROOT = Path(__file__).resolve().parents[1]
-WORKSPACE_DIR = REPO_ROOT
+# ---------- SHELL TOOL ----------
 
+# Same shell tool as dev_agent; the QA instructions keep it read-only on files.
+shell_tool = build_shell_tool(WORKSPACE_DIR, label="[QA] ")
+shell_executor = shell_tool.executor
 
-# ---------- SHELL EXECUTOR (same pattern as dev_agent, read-only on files) ----------
-
-async def require_approval(commands):
-    if os.environ.get("SHELL_AUTO_APPROVE") == "1":
-        return
-    print("\n[QA] Shell command approval required:")
-    for c in commands:
-        print("   ", c)
-    resp = input("Proceed? [y/N] ").strip().lower()
-    if resp not in {"y", "yes"}:
-        raise RuntimeError("Shell command execution rejected by user.")
-
-
-class ShellExecutor:
-    def __init__(self, cwd: Path):
-        self.cwd = cwd
-
-    async def __call__(self, request: ShellCommandRequest) -> ShellResult:
-        action = request.data.action
-        await require_approval(action.commands)
-
-        outputs = []
-
-        for command in action.commands:
-            proc = await asyncio.create_subprocess_shell(
-                command,
-                cwd=self.cwd,
-                env=os.environ.copy(),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
-
-            timed_out = False
-            try:
-                timeout = (action.timeout_ms or 0) / 1000 or None
-                stdout_bytes, stderr_bytes = await asyncio.wait_for(
-                    proc.communicate(),
-                    timeout=timeout,
-                )
-            except asyncio.TimeoutError:
-                proc.kill()
-                stdout_bytes, stderr_bytes = await proc.communicate()
-                timed_out = True
-
-            stdout = stdout_bytes.decode("utf-8", errors="ignore")
-            stderr = stderr_bytes.decode("utf-8", errors="ignore")
-
-            outcome = ShellCallOutcome(
-                type="timeout" if timed_out else "exit",
-                exit_code=getattr(proc, "returncode", None),
-            )
-
-            outputs.append(
-                ShellCommandOutput(
-                    command=command,
-                    stdout=stdout,
-                    stderr=stderr,
-                    outcome=outcome,
-                )
-            )
-
-            if timed_out:
-                break
-
-        return ShellResult(
-            output=outputs,
-            provider_data={"working_directory": str(self.cwd)},
-        )
-
-
-shell_tool = ShellTool(executor=ShellExecutor(cwd=WORKSPACE_DIR))
 
 # ---------- QA AGENT ----------
 
@@ -118,44 +46,75 @@ Behavior:
 - If all commands succeed, clearly say that the repo is passing QA.
 """
 
+# Cache key shared by every QA run with these instructions (see dev_agent).
+QA_INSTRUCTIONS_SHA256 = hashlib.sha256(QA_INSTRUCTIONS.encode("utf-8")).hexdigest()
+PROMPT_CACHE_KEY = f"levelup-qa-{QA_INSTRUCTIONS_SHA256[:32]}"
+
 qa_agent = Agent(
     name="LevelUp QA Agent",
     model="gpt-5.1",
     instructions=QA_INSTRUCTIONS,
+    model_settings=ModelSettings(extra_args={"prompt_cache_key": PROMPT_CACHE_KEY}),
     tools=[shell_tool],
 )
 
 
+# Raw tool-call classes worth a log line, by class name.
+_RAW_KIND = {
+    "LocalShellCall": "shell",
+    "ShellCall": "shell",
+}
+
+
+def _on_tool_call(item) -> None:
+    raw = item.raw_item
+    if _RAW_KIND.get(type(raw).__name__) == "shell":
+        action = getattr(raw, "action", None)
+        commands = getattr(action, "commands", None)
+        if commands:
+            print(f"[QA tool] shell – wants to run: {commands}")
+
+
+def _on_tool_output(item) -> None:
+    out_preview = preview(item.output)
+    print(f"[QA tool output]\n{out_preview}\n")
+
+
+def _on_message(item) -> None:
+    text = ItemHelpers.text_message_output(item)
+    if text.strip():
+        print(f"[QA report]\n{text}\n")
+
+
+_ITEM_HANDLERS = {
+    "tool_call_item": _on_tool_call,
+    "tool_call_output_item": _on_tool_output,
+    "message_output_item": _on_message,
+}
+
+
 async def run_qa(task: str):
     print("=== LevelUp QA Agent Run ===")
     print(f"[user QA request] {task}")
     print(f"Workspace: {WORKSPACE_DIR}\n")
 
+    use_pidfd_child_watcher()
+
+    # Warm the shell workers while the first model turn is in flight.
+    warmup = asyncio.ensure_future(shell_executor.start())
     result = Runner.run_streamed(qa_agent, input=task)
 
-    async for event in result.stream_events():
-        if event.type != "run_item_stream_event":
-            continue
-
-        item = event.item
-
-        if item.type == "tool_call_item":
-            raw = item.raw_item
-            raw_type_name = type(raw).__name__
-            if raw_type_name in ("LocalShellCall", "ShellCall"):
-                action = getattr(raw, "action", None)
-                commands = getattr(action, "commands", None)
-                if commands:
-                    print(f"[QA tool] shell – wants to run: {commands}")
-        elif item.type == "tool_call_output_item":
-            out_preview = str(item.output)
-            if len(out_preview) > 400:
-                out_preview = out_preview[:400] + "…"
-            print(f"[QA tool output]\n{out_preview}\n")
-        elif item.type == "message_output_item":
-            text = ItemHelpers.text_message_output(item)
-            if text.strip():
-                print(f"[QA report]\n{text}\n")
+    try:
+        async for event in result.stream_events():
+            if event.type != "run_item_stream_event":
+                continue
+
+            handler = _ITEM_HANDLERS.get(event.item.type)
+            if handler:
+                handler(event.item)
+    finally:
+        await warmup
+        await shell_executor.aclose()
 
     print("=== QA run complete ===\n")
     print("Final QA summary:\n")